@@ -6,13 +6,13 @@ Author: Nikolay Lysenko
 
 
 import argparse
+import logging
 import os
-from pkg_resources import resource_filename
 
-import yaml
 
-from rlmusician.agent import optimize_with_monte_carlo_beam_search
-from rlmusician.environment import CounterpointEnv, Piece
+DEFAULT_CONFIG_PATH = os.path.join(
+    os.path.dirname(__file__), 'configs', 'default_config.yml'
+)
 
 
 def parse_cli_args() -> argparse.Namespace:
@@ -24,7 +24,7 @@ def parse_cli_args() -> argparse.Namespace:
     """
     parser = argparse.ArgumentParser(description='Music composition with RL')
     parser.add_argument(
-        '-c', '--config_path', type=str, default=None,
+        '-c', '--config_path', type=str, default=DEFAULT_CONFIG_PATH,
         help='path to configuration file'
     )
     cli_args = parser.parse_args()
@@ -34,16 +34,19 @@ def parse_cli_args() -> argparse.Namespace:
 def main() -> None:
     """Parse CLI arguments, train agent, and test it."""
     cli_args = parse_cli_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
 
-    default_config_path = 'configs/default_config.yml'
-    default_config_path = resource_filename(__name__, default_config_path)
-    config_path = cli_args.config_path or default_config_path
-    with open(config_path) as config_file:
-        settings = yaml.safe_load(config_file)
+    # Heavy imports are deferred so that `--help` returns immediately.
+    import yaml
+    from rlmusician.agent import optimize_with_monte_carlo_beam_search
+    from rlmusician.environment import CounterpointEnv, Piece
+
+    loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+    with open(cli_args.config_path) as config_file:
+        settings = yaml.load(config_file, Loader=loader)
 
     results_dir = settings['piece']['rendering_params']['dir']
-    if not os.path.isdir(results_dir):
-        os.mkdir(results_dir)
+    os.makedirs(results_dir, exist_ok=True)
 
     piece = Piece(**settings['piece'])
     env = CounterpointEnv(piece, **settings['environment'])
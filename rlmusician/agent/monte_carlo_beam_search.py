@@ -5,13 +5,23 @@ Author: Nikolay Lysenko
 """
 
 
-import functools
+import itertools
+import logging
+import math
+import operator
 import random
-from copy import deepcopy
-from typing import Any, Dict, List, Optional, NamedTuple
+from multiprocessing.pool import Pool
+from typing import Any, Dict, List, Optional, NamedTuple, Tuple
 
 from rlmusician.environment import CounterpointEnv
-from rlmusician.utils import generate_copies, imap_in_parallel
+from rlmusician.environment.piece import PieceState
+from rlmusician.utils import PoolWithSize, create_pool
+
+
+logger = logging.getLogger(__name__)
+
+# Environment owned by a worker process, see `initialize_worker` function.
+_worker_env: Optional[CounterpointEnv] = None
 
 
 class EnvWithActions(NamedTuple):
@@ -21,6 +31,13 @@ class EnvWithActions(NamedTuple):
     actions: List[int]
 
 
+class StateWithActions(NamedTuple):
+    """A tuple of environment state and actions that have led to it."""
+
+    state: PieceState
+    actions: List[int]
+
+
 class Record(NamedTuple):
     """A record with finalized sequence of actions and resulting reward."""
 
@@ -28,7 +45,11 @@ class Record(NamedTuple):
     reward: float
 
 
-def roll_in(env: CounterpointEnv, actions: List[int]) -> EnvWithActions:
+def roll_in(
+        env: CounterpointEnv,
+        actions: List[int],
+        states_cache: Optional[Dict[Tuple[int, ...], PieceState]] = None
+) -> EnvWithActions:
     """
     Do roll-in actions.
 
@@ -36,44 +57,130 @@ def roll_in(env: CounterpointEnv, actions: List[int]) -> EnvWithActions:
         environment
     :param actions:
         sequence of roll-in actions
+    :param states_cache:
+        mapping from previous roll-in sequences to states of environment
+        after them; if it is passed, roll-in starts from the state that
+        corresponds to the longest cached prefix of `actions` and then
+        the state after `actions` is added to the mapping
     :return:
         environment after roll-in actions
     """
-    env.reset()
-    for action in actions:
+    key = tuple(actions)
+    cached_state = None
+    n_cached_actions = 0
+    if states_cache is not None:
+        for n_cached_actions in range(len(key), -1, -1):
+            cached_state = states_cache.get(key[:n_cached_actions])
+            if cached_state is not None:
+                break
+    if cached_state is not None:
+        env.set_state(cached_state)
+    else:
+        n_cached_actions = 0
+        env.reset()
+    for action in actions[n_cached_actions:]:
         env.step(action)
+    if states_cache is not None and key not in states_cache:
+        states_cache[key] = env.get_state()
     env_with_actions = EnvWithActions(env, actions)
     return env_with_actions
 
 
-def roll_out_randomly(env_with_actions: EnvWithActions) -> Record:  # pragma: no cover
+def initialize_worker(env: CounterpointEnv) -> None:  # pragma: no cover
+    """
+    Store environment in a worker process and seed its random generator.
+
+    :param env:
+        environment; its state does not matter, because it is overwritten
+        at the start of each random trial
+    :return:
+        None
+    """
+    global _worker_env
+    _worker_env = env
+    random.seed()  # Reseed to have independent results amongst processes.
+
+
+def roll_out_randomly(state_with_actions: StateWithActions) -> Record:  # pragma: no cover
     """
     Continue an episode in progress with random actions until it is finished.
 
-    :param env_with_actions:
-        environment and sequence of actions that have been taken before
+    This function must be called from a worker process that has been set up
+    with `initialize_worker` function.
+
+    :param state_with_actions:
+        state of environment and sequence of actions that have led to it
     :return:
         finalized sequence of actions and reward for the episode
     """
-    random.seed()  # Reseed to have independent results amongst processes.
-    env = env_with_actions.env
-    past_actions = env_with_actions.actions
+    env = _worker_env
+    env.set_state(state_with_actions.state)
+    past_actions = list(state_with_actions.actions)
     done = False
     valid_actions = env.valid_actions
     while not done:
         action = random.choice(valid_actions)
         observation, reward, done, info = env.step(action)
         past_actions.append(action)
-        valid_actions = info['next_actions']
+        valid_actions = env.valid_actions
     record = Record(past_actions, reward)
     return record
 
 
+def explore_randomly(env: CounterpointEnv, n_steps: int) -> int:
+    """
+    Play random actions and multiply numbers of options met along the way.
+
+    :param env:
+        environment; it is left in the state after exploration
+    :param n_steps:
+        maximum number of steps ahead to explore
+    :return:
+        product of numbers of valid actions before each step
+    """
+    done = False
+    valid_actions = env.valid_actions
+    n_options = []
+    while not done and len(n_options) < n_steps:
+        n_options.append(len(valid_actions))
+        action = random.choice(valid_actions)
+        observation, reward, done, info = env.step(action)
+        valid_actions = env.valid_actions
+    estimation = math.prod(n_options)
+    return estimation
+
+
+class ExplorationTask(NamedTuple):
+    """A tuple of environment state and number of steps to explore from it."""
+
+    state: PieceState
+    n_steps: int
+
+
+def explore_randomly_in_worker(task: ExplorationTask) -> int:  # pragma: no cover
+    """
+    Play random actions from a state and multiply numbers of met options.
+
+    This function must be called from a worker process that has been set up
+    with `initialize_worker` function.
+
+    :param task:
+        state of environment and maximum number of steps to explore from it
+    :return:
+        product of numbers of valid actions before each step
+    """
+    env = _worker_env
+    env.set_state(task.state)
+    estimation = explore_randomly(env, task.n_steps)
+    return estimation
+
+
 def estimate_number_of_trials(
         env: CounterpointEnv,
         n_trials_estimation_depth: int,
         n_trials_estimation_width: int,
-        n_trials_factor: float
+        n_trials_factor: float,
+        pool: Optional[Pool] = None
 ) -> int:
     """
     Estimate number of trials.
@@ -86,7 +193,7 @@ def estimate_number_of_trials(
     * Trials are distributed less even.
 
     :param env:
-        environment
+        environment; it is restored to its initial state after exploration
     :param n_trials_estimation_depth:
         number of steps ahead to explore in order to collect statistics
         for inferring number of random trials to continue each stub
@@ -95,24 +202,31 @@ def estimate_number_of_trials(
         for inferring number of random trials to continue each stub
     :param n_trials_factor:
         factor such that estimated number of trials is multiplied by it
+    :param pool:
+        pool of worker processes that run exploratory trials in parallel;
+        these processes must be set up with `initialize_worker` function;
+        if it is not passed, exploratory trials are run in current process
     :return:
         number of trials to continue a stub at random
     """
-    estimations = []
-    for _ in range(n_trials_estimation_width):
-        current_env = deepcopy(env)
-        done = False
-        valid_actions = current_env.valid_actions
-        n_steps_passed = 0
-        n_options = []
-        while not done and n_steps_passed < n_trials_estimation_depth:
-            n_options.append(len(valid_actions))
-            action = random.choice(valid_actions)
-            observation, reward, done, info = current_env.step(action)
-            valid_actions = info['next_actions']
-            n_steps_passed += 1
-        estimation = functools.reduce(lambda x, y: x * y, n_options, 1)
-        estimations.append(estimation)
+    if n_trials_estimation_depth <= 1:
+        # Exploratory trials are redundant, because all of them are the same.
+        n_options = len(env.valid_actions) if n_trials_estimation_depth else 1
+        return int(round(n_trials_factor * n_options))
+    initial_state = env.get_state()
+    if pool is not None:
+        task = ExplorationTask(initial_state, n_trials_estimation_depth)
+        estimations = pool.map(
+            explore_randomly_in_worker,
+            itertools.repeat(task, n_trials_estimation_width)
+        )
+    else:
+        estimations = []
+        for _ in range(n_trials_estimation_width):
+            env.set_state(initial_state)
+            estimation = explore_randomly(env, n_trials_estimation_depth)
+            estimations.append(estimation)
+        env.set_state(initial_state)
     n_trials = n_trials_factor * sum(estimations) / n_trials_estimation_width
     n_trials = int(round(n_trials))
     return n_trials
@@ -125,7 +239,8 @@ def add_records(
         n_trials_estimation_depth: int,
         n_trials_estimation_width: int,
         n_trials_factor: float,
-        paralleling_params: Dict[str, Any]
+        pool_with_size: PoolWithSize,
+        states_cache: Dict[Tuple[int, ...], PieceState]
 ) -> List[Record]:
     """
     Play new episodes given roll-in sequences and add new records with results.
@@ -145,26 +260,44 @@ def add_records(
         for inferring number of random trials to continue each stub
     :param n_trials_factor:
         factor such that estimated number of trials is multiplied by it
-    :param paralleling_params:
-        settings of parallel playing of episodes
+    :param pool_with_size:
+        pool of worker processes that play episodes in parallel and number
+        of these processes; the processes must be set up with
+        `initialize_worker` function
+    :param states_cache:
+        mapping from roll-in sequences of the previous iteration to states
+        of environment after them; it is updated in place so that only
+        current roll-in sequences remain
     :return:
         extended statistics of finished episodes as sequences of actions and
         corresponding to them rewards
     """
+    pool, n_processes = pool_with_size
+    tasks = []
+    total_n_trials = 0
     for stub in stubs:
-        env_with_actions = roll_in(env, stub)
+        env_with_actions = roll_in(env, stub, states_cache)
         n_trials = estimate_number_of_trials(
             env_with_actions.env,
             n_trials_estimation_depth,
             n_trials_estimation_width,
-            n_trials_factor
-        )
-        records_for_stub = imap_in_parallel(
-            roll_out_randomly,
-            generate_copies(env_with_actions, n_trials),
-            paralleling_params
+            n_trials_factor,
+            pool
         )
-        records.extend(records_for_stub)
+        state = states_cache[tuple(stub)]
+        state_with_actions = StateWithActions(state, stub)
+        tasks.append(itertools.repeat(state_with_actions, n_trials))
+        total_n_trials += n_trials
+    # All stubs are submitted at once, so workers do not idle between them.
+    new_records = pool.imap_unordered(
+        roll_out_randomly,
+        itertools.chain.from_iterable(tasks),
+        chunksize=max(total_n_trials // (4 * n_processes), 1)
+    )
+    records.extend(new_records)
+    current_keys = {tuple(stub) for stub in stubs}
+    for key in set(states_cache) - current_keys:
+        del states_cache[key]
     return records
 
 
@@ -193,17 +326,19 @@ def create_stubs(
         that are finalized)
     """
     stubs = []
+    seen_keys = set()
     for record in records:
         if len(stubs) == n_stubs:
             break
-        key = record.actions[:stub_length]
-        if key in stubs:
+        key = tuple(record.actions[:stub_length])
+        if key in seen_keys:
             continue
         if len(record.actions) <= stub_length:
             if include_finalized_sequences:  # pragma: no branch
                 n_stubs -= 1
             continue
-        stubs.append(key)
+        seen_keys.add(key)
+        stubs.append(list(key))
     return stubs
 
 
@@ -224,8 +359,11 @@ def select_distinct_best_records(
         best records
     """
     results = []
+    seen_keys = set()
     for record in records:
-        if record not in results:
+        key = (tuple(record.actions), record.reward)
+        if key not in seen_keys:
+            seen_keys.add(key)
             results.append(record)
         if len(results) == n_records:
             break
@@ -262,31 +400,39 @@ def optimize_with_monte_carlo_beam_search(
         settings of parallel playing of episodes;
         by default, number of processes is set to number of cores
         and each worker is not replaced with a newer one after some number of
-        tasks are finished
+        tasks are finished; one pool of workers is used for the whole search
     :return:
         best final sequences of actions
     """
     stubs = [[]]
     records = []
-    paralleling_params = paralleling_params or {}
+    states_cache = {}
     stub_length = 0
-    while len(stubs) > 0:
-        records = add_records(
-            env,
-            stubs,
-            records,
-            n_trials_estimation_depth,
-            n_trials_estimation_width,
-            n_trials_factor,
-            paralleling_params
-        )
-        records = sorted(records, key=lambda x: x.reward, reverse=True)
-        print(
-            f"Current best reward: {records[0].reward:.5f}, "
-            f"achieved with: {records[0].actions}."
-        )
-        stub_length += 1
-        stubs = create_stubs(records, beam_width, stub_length)
-        records = select_distinct_best_records(records, n_records_to_keep)
+    pool_with_size = create_pool(
+        paralleling_params, initialize_worker, (env,)
+    )
+    try:
+        while len(stubs) > 0:
+            records = add_records(
+                env,
+                stubs,
+                records,
+                n_trials_estimation_depth,
+                n_trials_estimation_width,
+                n_trials_factor,
+                pool_with_size,
+                states_cache
+            )
+            records.sort(key=operator.attrgetter('reward'), reverse=True)
+            logger.info(
+                "Current best reward: %.5f, achieved with: %s.",
+                records[0].reward, records[0].actions
+            )
+            stub_length += 1
+            stubs = create_stubs(records, beam_width, stub_length)
+            records = select_distinct_best_records(records, n_records_to_keep)
+    finally:
+        pool_with_size.pool.close()
+        pool_with_size.pool.join()
     results = [past_actions for past_actions, reward in records[:beam_width]]
     return results
@@ -10,9 +10,8 @@ from typing import Any, Dict, List, Tuple
 import gym
 import numpy as np
 
-from rlmusician.environment.piece import Piece
+from rlmusician.environment.piece import Piece, PieceState
 from rlmusician.environment.evaluation import evaluate
-from rlmusician.utils import convert_to_base
 
 
 class CounterpointEnv(gym.Env):
@@ -57,37 +56,44 @@ class CounterpointEnv(gym.Env):
         self.action_space = gym.spaces.Discrete(n_actions)
         self.action_to_line_continuation = None
         self.__set_action_to_line_continuation()
+        self._valid_actions = None
+        self.__update_valid_actions()
 
         self.observation_space = gym.spaces.Box(
             low=0,
             high=1,
             shape=self.piece.piano_roll.shape,
-            dtype=np.int32
+            dtype=np.uint8
         )
 
     def __set_action_to_line_continuation(self) -> None:
         """Create mapping from action to a pair of movement and duration."""
         base = len(self.piece.all_movements)
-        required_len = 2
-        raw_mapping = {
-            action: (x for x in convert_to_base(action, base, required_len))
-            for action in range(self.action_space.n)
-        }
         offset = self.piece.max_skip
-        action_to_continuation = {
-            action: (movement_id - offset, 2 ** duration_id)
-            for action, (duration_id, movement_id) in raw_mapping.items()
-        }
+        action_to_continuation = {}
+        for action in range(self.action_space.n):
+            duration_id, movement_id = divmod(action, base)
+            action_to_continuation[action] = (
+                movement_id - offset, 2 ** duration_id
+            )
         self.action_to_line_continuation = action_to_continuation
 
+    def __update_valid_actions(self) -> None:
+        """Find actions that are valid at the current step."""
+        indicators = self.piece.check_validity_batch(
+            self.action_to_line_continuation.values()
+        )
+        self._valid_actions = tuple(
+            action
+            for action, is_valid
+            in zip(self.action_to_line_continuation, indicators)
+            if is_valid
+        )
+
     @property
     def valid_actions(self) -> List[int]:
         """Get actions that are valid at the current step."""
-        valid_actions = [
-            i for i in range(self.action_space.n)
-            if self.piece.check_validity(*self.action_to_line_continuation[i])
-        ]
-        return valid_actions
+        return list(self._valid_actions)
 
     def step(self, action: int) -> Tuple[np.ndarray, float, bool, Dict]:
         """
@@ -105,6 +111,7 @@ class CounterpointEnv(gym.Env):
         """
         movement, duration = self.action_to_line_continuation[action]
         self.piece.add_line_element(movement, duration)
+        self.__update_valid_actions()
 
         observation = self.piece.piano_roll
         info = {'next_actions': self.valid_actions}
@@ -137,9 +144,32 @@ class CounterpointEnv(gym.Env):
             initial observation
         """
         self.piece.reset()
+        self.__update_valid_actions()
         initial_observation = self.piece.piano_roll
         return initial_observation
 
+    def get_state(self) -> PieceState:
+        """
+        Get current state of the environment.
+
+        :return:
+            snapshot that is independent of further steps of the environment
+        """
+        return self.piece.get_state()
+
+    def set_state(self, state: PieceState) -> None:
+        """
+        Restore the environment from a snapshot of its state.
+
+        :param state:
+            snapshot returned by `get_state` method of this or identical
+            environment
+        :return:
+            None
+        """
+        self.piece.set_state(state)
+        self.__update_valid_actions()
+
     def render(self, mode='human'):  # pragma: no cover.
         """
         Save piece in various formats.
@@ -14,9 +14,9 @@ Author: Nikolay Lysenko
 """
 
 
-import datetime
 import os
-from typing import Any, Dict, List, NamedTuple
+import time
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
 
 import numpy as np
 from sinethesizer.utils.music_theory import get_note_to_position_mapping
@@ -46,6 +46,17 @@ class LineElement(NamedTuple):
     end_time_in_eighths: int
 
 
+class PieceState(NamedTuple):
+    """A snapshot of all attributes of a piece that change at runtime."""
+
+    counterpoint: List[LineElement]
+    current_time_in_eighths: int
+    current_measure_durations: List[int]
+    past_movements: List[int]
+    current_motion_start_element: LineElement
+    is_last_element_consonant: bool
+
+
 class Piece:
     """Piece where florid counterpoint line is created given cantus firmus."""
 
@@ -85,6 +96,11 @@ class Piece:
 
         # Calculated attributes.
         self.scale = Scale(tonic, scale_type)
+        registry = get_rules_registry()
+        self.rules_with_params = [
+            (registry[rule_name], self.rules_params.get(rule_name, {}))
+            for rule_name in self.names_of_rules
+        ]
         self.max_skip = counterpoint_specifications['max_skip_in_degrees']
         self.all_movements = list(range(-self.max_skip, self.max_skip + 1))
         self.n_measures = len(cantus_firmus)
@@ -190,7 +206,7 @@ class Piece:
     def __initialize_piano_roll(self) -> None:
         """Create piano roll and place all pre-defined notes to it."""
         shape = (len(NOTE_TO_POSITION), self.total_duration_in_eighths)
-        self._piano_roll = np.zeros(shape, dtype=np.int32)
+        self._piano_roll = np.zeros(shape, dtype=np.uint8)
 
         for line_element in self.cantus_firmus:
             self.__add_to_piano_roll(line_element)
@@ -264,50 +280,76 @@ class Piece:
         result = self.cantus_firmus[index]
         return result
 
-    def __check_range(self, movement: int) -> bool:
-        """Check that movement does not lead beyond a range of a line."""
-        next_position = self.__find_next_position_in_degrees(movement)
-        if next_position < self.lowest_element.position_in_degrees:
-            return False
-        if next_position > self.highest_element.position_in_degrees:
-            return False
-        return True
-
-    def __check_total_duration(self, duration: int) -> bool:
-        """Check that nothing is suspended to the last measure."""
-        available_duration = N_EIGHTHS_PER_MEASURE * (self.n_measures - 1)
-        return self.current_time_in_eighths + duration <= available_duration
-
-    def __check_rules(self, movement: int, duration: int) -> bool:
-        """Check compliance with the rules."""
-        registry = get_rules_registry()
-        continuation = self.__find_next_element(movement, duration)
-        durations = [x for x in self.current_measure_durations] + [duration]
-        cantus_firmus_elements = self.__find_cf_elements(duration)
+    def __create_state_for_rules(self) -> Dict[str, Any]:
+        """Create part of rules arguments that is shared by continuations."""
         previous_cantus_firmus_element = self.__find_previous_cf_element()
         state = {
             'line': self.counterpoint,
-            'counterpoint_continuation': continuation,
-            'movement': movement,
             'past_movements': self.past_movements,
             'piece_duration': self.total_duration_in_eighths,
             'current_measure_durations': self.current_measure_durations,
-            'durations': durations,
-            'cantus_firmus_elements': cantus_firmus_elements,
             'previous_cantus_firmus_element': previous_cantus_firmus_element,
             'current_motion_start_element': self.current_motion_start_element,
             'is_last_element_consonant': self.is_last_element_consonant,
             'is_counterpoint_above': self.is_counterpoint_above,
             'counterpoint_end': self.end_scale_element,
         }
-        for rule_name in self.names_of_rules:
-            rule_fn = registry[rule_name]
-            rule_fn_params = self.rules_params.get(rule_name, {})
+        return state
+
+    def __check_rules(
+            self, movement: int, duration: int, state: Dict[str, Any]
+    ) -> bool:
+        """Check compliance with the rules."""
+        state['counterpoint_continuation'] = self.__find_next_element(
+            movement, duration
+        )
+        state['movement'] = movement
+        state['durations'] = self.current_measure_durations + [duration]
+        state['cantus_firmus_elements'] = self.__find_cf_elements(duration)
+        for rule_fn, rule_fn_params in self.rules_with_params:
             is_compliant = rule_fn(**state, **rule_fn_params)
             if not is_compliant:
                 return False
         return True
 
+    def check_validity_batch(
+            self, continuations: Iterable[Tuple[int, int]]
+    ) -> List[bool]:
+        """
+        Check whether each of suggested continuations is valid.
+
+        It is equivalent to calling `check_validity` method for each
+        continuation, but computations that do not depend on a continuation
+        are done only once.
+
+        :param continuations:
+            pairs of movement (shift in scale degrees from previous element
+            to a new one) and duration (in eighths) of a new element
+        :return:
+            indicators whether corresponding continuations are valid
+        """
+        last_position = self.counterpoint[-1].scale_element.position_in_degrees
+        min_movement = max(
+            -self.max_skip,
+            self.lowest_element.position_in_degrees - last_position
+        )
+        max_movement = min(
+            self.max_skip,
+            self.highest_element.position_in_degrees - last_position
+        )
+        available_duration = (
+            N_EIGHTHS_PER_MEASURE * (self.n_measures - 1)
+            - self.current_time_in_eighths
+        )
+        state = self.__create_state_for_rules()
+        results = [
+            min_movement <= movement <= max_movement
+            and duration <= available_duration
+            and self.__check_rules(movement, duration, state)
+            for movement, duration in continuations
+        ]
+        return results
+
     def check_validity(self, movement: int, duration: int) -> bool:
         """
         Check whether suggested continuation is valid.
@@ -319,15 +361,7 @@ class Piece:
         :return:
             `True` if the continuation is valid, `False` else
         """
-        if movement not in self.all_movements:
-            return False
-        if not self.__check_range(movement):
-            return False
-        if not self.__check_total_duration(duration):
-            return False
-        if not self.__check_rules(movement, duration):
-            return False
-        return True
+        return self.check_validity_batch([(movement, duration)])[0]
 
     def __update_current_measure_durations(self, duration: int) -> None:
         """Update division of current measure by played notes."""
@@ -418,6 +452,42 @@ class Piece:
         self.__initialize_piano_roll()
         self.__set_defaults_to_runtime_variables()
 
+    def get_state(self) -> PieceState:
+        """
+        Get current state of the piece.
+
+        :return:
+            snapshot that is independent of further changes of the piece
+        """
+        state = PieceState(
+            counterpoint=list(self.counterpoint),
+            current_time_in_eighths=self.current_time_in_eighths,
+            current_measure_durations=list(self.current_measure_durations),
+            past_movements=list(self.past_movements),
+            current_motion_start_element=self.current_motion_start_element,
+            is_last_element_consonant=self.is_last_element_consonant
+        )
+        return state
+
+    def set_state(self, state: PieceState) -> None:
+        """
+        Restore the piece from a snapshot of its state.
+
+        :param state:
+            snapshot returned by `get_state` method of this or identical piece
+        :return:
+            None
+        """
+        self.counterpoint = list(state.counterpoint)
+        self.__initialize_piano_roll()
+        for line_element in self.counterpoint[1:]:
+            self.__add_to_piano_roll(line_element)
+        self.current_time_in_eighths = state.current_time_in_eighths
+        self.current_measure_durations = list(state.current_measure_durations)
+        self.past_movements = list(state.past_movements)
+        self.current_motion_start_element = state.current_motion_start_element
+        self.is_last_element_consonant = state.is_last_element_consonant
+
     @property
     def piano_roll(self) -> np.ndarray:
         """Get piece representation as piano roll (without irrelevant rows)."""
@@ -435,8 +505,7 @@ class Piece:
             None
         """
         top_level_dir = self.rendering_params['dir']
-        now = datetime.datetime.now().strftime("%Y-%m-%d_%H:%M:%S,%f")
-        nested_dir = os.path.join(top_level_dir, f"result_{now}")
+        nested_dir = os.path.join(top_level_dir, f"result_{time.time_ns()}")
         os.mkdir(nested_dir)
 
         midi_path = os.path.join(nested_dir, 'music.mid')
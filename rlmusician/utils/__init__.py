@@ -13,7 +13,9 @@ from .io import (
     create_wav_from_events,
 )
 from .misc import (
+    PoolWithSize,
     convert_to_base,
+    create_pool,
     imap_in_parallel,
     generate_copies,
     rolling_aggregate,
@@ -22,10 +24,12 @@ from .music_theory import Scale, ScaleElement, check_consonance
 
 
 __all__ = [
+    'PoolWithSize',
     'Scale',
     'ScaleElement',
     'check_consonance',
     'convert_to_base',
+    'create_pool',
     'create_events_from_piece',
     'create_lilypond_file_from_piece',
     'create_midi_from_piece',
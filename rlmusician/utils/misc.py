@@ -7,7 +7,18 @@ Author: Nikolay Lysenko
 
 import copy
 import multiprocessing as mp
-from typing import Any, Callable, Dict, Iterator, List, Optional
+import os
+from multiprocessing.pool import Pool
+from typing import (
+    Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+)
+
+
+class PoolWithSize(NamedTuple):
+    """A tuple of pool of worker processes and number of these processes."""
+
+    pool: Pool
+    n_processes: int
 
 
 def convert_to_base(
@@ -39,6 +50,36 @@ def convert_to_base(
     return digits
 
 
+def create_pool(
+        pool_kwargs: Optional[Dict[str, Any]] = None,
+        initializer: Optional[Callable] = None,
+        initargs: Tuple[Any, ...] = ()
+) -> PoolWithSize:
+    """
+    Create pool of worker processes.
+
+    :param pool_kwargs:
+        parameters of pool such as number of processes and maximum number of
+        tasks for a worker before it is replaced with a new one
+    :param initializer:
+        function that is called by each worker process when it starts
+    :param initargs:
+        arguments to be passed to `initializer`
+    :return:
+        pool of worker processes and number of them; by default, number of
+        processes is set to number of cores; the pool must be closed and
+        joined by the caller
+    """
+    pool_kwargs = dict(pool_kwargs or {})
+    n_processes = pool_kwargs.pop('n_processes', None) or os.cpu_count() or 1
+    pool_kwargs['processes'] = n_processes
+    pool_kwargs['maxtasksperchild'] = pool_kwargs.pop(
+        'max_tasks_per_child', None
+    )
+    pool = mp.Pool(initializer=initializer, initargs=initargs, **pool_kwargs)
+    return PoolWithSize(pool, n_processes)
+
+
 def imap_in_parallel(
         fn: Callable,
         args: Iterator[Any],
@@ -65,12 +106,7 @@ def imap_in_parallel(
     :return:
         results of applying the function to the arguments
     """
-    pool_kwargs = pool_kwargs or {}
-    pool_kwargs['processes'] = pool_kwargs.get('n_processes')
-    pool_kwargs['maxtasksperchild'] = pool_kwargs.get('max_tasks_per_child')
-    old_keys = ['n_processes', 'max_tasks_per_child']
-    pool_kwargs = {k: v for k, v in pool_kwargs.items() if k not in old_keys}
-    pool = mp.Pool(**pool_kwargs)
+    pool = create_pool(pool_kwargs).pool
     try:
         results = pool.imap(fn, args)
     finally:
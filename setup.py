@@ -38,7 +38,7 @@ setup(
             'configs/sinethesizer_presets.yml'
         ]
     },
-    python_requires='>=3.6',
+    python_requires='>=3.8',
     install_requires=[
         'gym',
         'numpy',
@@ -7,16 +7,20 @@ Author: Nikolay Lysenko
 
 from typing import Any, Dict, List
 
+import numpy as np
 import pytest
 
 from rlmusician.agent.monte_carlo_beam_search import (
     Record,
     create_stubs,
     estimate_number_of_trials,
+    initialize_worker,
     optimize_with_monte_carlo_beam_search,
+    roll_in,
     select_distinct_best_records
 )
 from rlmusician.environment import CounterpointEnv, Piece
+from rlmusician.utils import create_pool
 
 
 @pytest.mark.parametrize(
@@ -90,7 +94,7 @@ def test_create_stubs(
 
 @pytest.mark.parametrize(
     "env, actions, n_trials_estimation_depth, n_trials_estimation_width, "
-    "n_trials_factor",
+    "n_trials_factor, use_pool",
     [
         (
             # `env`
@@ -125,22 +129,111 @@ def test_create_stubs(
             3,
             # `n_trials_factor`
             1,
+            # `use_pool`
+            False,
+        ),
+        (
+            # `env`
+            CounterpointEnv(
+                piece=Piece(
+                    tonic='C',
+                    scale_type='major',
+                    cantus_firmus=['C4', 'D4', 'E4', 'D4', 'C4'],
+                    counterpoint_specifications={
+                        'start_note': 'E4',
+                        'end_note': 'E4',
+                        'lowest_note': 'G3',
+                        'highest_note': 'G4',
+                        'start_pause_in_eighths': 4,
+                        'max_skip_in_degrees': 2,
+                    },
+                    rules={
+                        'names': ['rearticulation_stability'],
+                        'params': {}
+                    },
+                    rendering_params={}
+                ),
+                reward_for_dead_end=-100,
+                scoring_coefs={'entropy': 1},
+                scoring_fn_params={},
+            ),
+            # `actions`
+            [1],
+            # `n_trials_estimation_depth`
+            2,
+            # `n_trials_estimation_width`
+            3,
+            # `n_trials_factor`
+            1,
+            # `use_pool`
+            True,
+        ),
+        (
+            # `env`
+            CounterpointEnv(
+                piece=Piece(
+                    tonic='C',
+                    scale_type='major',
+                    cantus_firmus=['C4', 'D4', 'E4', 'D4', 'C4'],
+                    counterpoint_specifications={
+                        'start_note': 'E4',
+                        'end_note': 'E4',
+                        'lowest_note': 'G3',
+                        'highest_note': 'G4',
+                        'start_pause_in_eighths': 4,
+                        'max_skip_in_degrees': 2,
+                    },
+                    rules={
+                        'names': ['rearticulation_stability'],
+                        'params': {}
+                    },
+                    rendering_params={}
+                ),
+                reward_for_dead_end=-100,
+                scoring_coefs={'entropy': 1},
+                scoring_fn_params={},
+            ),
+            # `actions`
+            [1],
+            # `n_trials_estimation_depth`
+            1,
+            # `n_trials_estimation_width`
+            3,
+            # `n_trials_factor`
+            1,
+            # `use_pool`
+            False,
         ),
     ]
 )
 def test_estimate_number_of_trials(
         env: CounterpointEnv, actions: List[int],
         n_trials_estimation_depth: int, n_trials_estimation_width: int,
-        n_trials_factor: float
+        n_trials_factor: float, use_pool: bool
 ) -> None:
     """Test `estimate_number_of_trials` function."""
     for action in actions:
         env.step(action)
-    result = estimate_number_of_trials(
-        env,
-        n_trials_estimation_depth, n_trials_estimation_width, n_trials_factor
-    )
-    assert result > 0
+    expected_roll = env.piece.piano_roll.copy()
+    pool = None
+    if use_pool:
+        pool = create_pool({'n_processes': 2}, initialize_worker, (env,)).pool
+    try:
+        result = estimate_number_of_trials(
+            env,
+            n_trials_estimation_depth, n_trials_estimation_width,
+            n_trials_factor, pool
+        )
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    if n_trials_estimation_depth <= 1:
+        expected = round(n_trials_factor * len(env.valid_actions))
+        assert result == expected
+    else:
+        assert result > 0
+    np.testing.assert_equal(env.piece.piano_roll, expected_roll)
 
 
 @pytest.mark.parametrize(
@@ -204,6 +297,57 @@ def test_optimize_with_monte_carlo_beam_search(
     assert len(results) == beam_width
 
 
+@pytest.mark.parametrize(
+    "env, cached_stubs, actions",
+    [
+        (
+            # `env`
+            CounterpointEnv(
+                piece=Piece(
+                    tonic='C',
+                    scale_type='major',
+                    cantus_firmus=['C4', 'D4', 'E4', 'D4', 'C4'],
+                    counterpoint_specifications={
+                        'start_note': 'E4',
+                        'end_note': 'E4',
+                        'lowest_note': 'G3',
+                        'highest_note': 'G4',
+                        'start_pause_in_eighths': 4,
+                        'max_skip_in_degrees': 2,
+                    },
+                    rules={
+                        'names': ['rearticulation_stability'],
+                        'params': {}
+                    },
+                    rendering_params={}
+                ),
+                reward_for_dead_end=-100,
+                scoring_coefs={'entropy': 1},
+                scoring_fn_params={},
+            ),
+            # `cached_stubs`
+            [[], [14], [14, 6], [1]],
+            # `actions`
+            [14, 6, 8],
+        ),
+    ]
+)
+def test_roll_in(
+        env: CounterpointEnv, cached_stubs: List[List[int]],
+        actions: List[int]
+) -> None:
+    """Test that `roll_in` function gives the same results with cache."""
+    expected_roll = roll_in(env, actions).env.piece.piano_roll.copy()
+    expected_movements = list(env.piece.past_movements)
+    states_cache = {}
+    for stub in cached_stubs:
+        roll_in(env, stub, states_cache)
+    result = roll_in(env, actions, states_cache)
+    np.testing.assert_equal(result.env.piece.piano_roll, expected_roll)
+    assert env.piece.past_movements == expected_movements
+    assert tuple(actions) in states_cache
+
+
 @pytest.mark.parametrize(
     "records, n_records, expected",
     [
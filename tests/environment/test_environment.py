@@ -128,6 +128,8 @@ class TestCounterpointEnv:
             observation, reward, done, info = env.step(action)
         result = info['next_actions']
         assert result == expected
+        result.clear()
+        assert env.valid_actions == expected
 
     @pytest.mark.parametrize(
         "env, actions, expected",
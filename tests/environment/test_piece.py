@@ -286,7 +286,7 @@ class TestPiece:
             candidate_steps: List[Tuple[int, int]],
             expected: List[bool]
     ) -> None:
-        """Test `check_validity` method."""
+        """Test `check_validity` and `check_validity_batch` methods."""
         piece = Piece(
             tonic, scale_type, cantus_firmus, counterpoint_specifications,
             rules, rendering_params={}
@@ -298,6 +298,8 @@ class TestPiece:
             for movement, duration in candidate_steps
         ]
         assert result == expected
+        result = piece.check_validity_batch(candidate_steps)
+        assert result == expected
 
     @pytest.mark.parametrize(
         "tonic, scale_type, cantus_firmus, counterpoint_specifications, "
@@ -585,3 +587,70 @@ class TestPiece:
         assert piece.past_movements == []
         assert piece.current_time_in_eighths == 8
         np.testing.assert_equal(piece.piano_roll, expected_roll)
+
+    @pytest.mark.parametrize(
+        "tonic, scale_type, cantus_firmus, counterpoint_specifications, "
+        "rules, steps_before_snapshot, steps_after_snapshot",
+        [
+            (
+                # `tonic`
+                'C',
+                # `scale_type`
+                'major',
+                # `cantus_firmus`
+                ['C4', 'D4', 'E4', 'D4', 'C4'],
+                # `counterpoint_specifications`
+                {
+                    'start_note': 'E4',
+                    'end_note': 'E4',
+                    'lowest_note': 'G3',
+                    'highest_note': 'G4',
+                    'start_pause_in_eighths': 4,
+                    'max_skip_in_degrees': 2,
+                },
+                # `rules`
+                {
+                    'names': ['rearticulation_stability'],
+                    'params': {}
+                },
+                # `steps_before_snapshot`
+                [(-2, 4), (-2, 4)],
+                # `steps_after_snapshot`
+                [(-1, 4), (2, 8), (1, 2), (0, 1)],
+            ),
+        ]
+    )
+    def test_get_state_and_set_state(
+            self, tonic: str, scale_type: str, cantus_firmus: List[str],
+            counterpoint_specifications: Dict[str, Any], rules: Dict[str, Any],
+            steps_before_snapshot: List[Tuple[int, int]],
+            steps_after_snapshot: List[Tuple[int, int]]
+    ) -> None:
+        """Test that `set_state` restores what `get_state` has saved."""
+        piece = Piece(
+            tonic, scale_type, cantus_firmus, counterpoint_specifications,
+            rules, rendering_params={}
+        )
+        for movement, duration in steps_before_snapshot:
+            piece.add_line_element(movement, duration)
+        state = piece.get_state()
+        expected_roll = piece.piano_roll.copy()
+        expected_counterpoint = list(piece.counterpoint)
+        expected_past_movements = list(piece.past_movements)
+        expected_measure_durations = list(piece.current_measure_durations)
+        expected_time = piece.current_time_in_eighths
+
+        for movement, duration in steps_after_snapshot:
+            piece.add_line_element(movement, duration)
+        piece.set_state(state)
+        assert piece.counterpoint == expected_counterpoint
+        assert piece.past_movements == expected_past_movements
+        assert piece.current_measure_durations == expected_measure_durations
+        assert piece.current_time_in_eighths == expected_time
+        np.testing.assert_equal(piece.piano_roll, expected_roll)
+
+        for movement, duration in steps_after_snapshot:
+            piece.add_line_element(movement, duration)
+        assert piece.get_state().past_movements != state.past_movements
+        piece.set_state(state)
+        assert piece.past_movements == expected_past_movements
@@ -5,11 +5,13 @@ Author: Nikolay Lysenko
 """
 
 
-from typing import Callable, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import pytest
 
-from rlmusician.utils.misc import convert_to_base, rolling_aggregate
+from rlmusician.utils.misc import (
+    convert_to_base, create_pool, rolling_aggregate
+)
 
 
 @pytest.mark.parametrize(
@@ -29,6 +31,28 @@ def test_convert_to_base(
     assert result == expected
 
 
+@pytest.mark.parametrize(
+    "pool_kwargs, args, expected",
+    [
+        ({'n_processes': 1}, [-1, 2, -3], [1, 2, 3]),
+        ({'n_processes': 2, 'max_tasks_per_child': 1}, [-4, 5], [4, 5]),
+    ]
+)
+def test_create_pool(
+        pool_kwargs: Dict[str, Any], args: List[int], expected: List[int]
+) -> None:
+    """Test `create_pool` function."""
+    pool, n_processes = create_pool(pool_kwargs)
+    try:
+        result = pool.map(abs, args)
+    finally:
+        pool.close()
+        pool.join()
+    assert result == expected
+    assert n_processes == pool_kwargs['n_processes']
+    assert 'processes' not in pool_kwargs
+
+
 @pytest.mark.parametrize(
     "values, aggregation_fn, window_size, expected",
     [